@@ -0,0 +1,43 @@
+import os
+import sys
+import tensorflow as tf
+import cv2
+import numpy as np
+
+KERAS_MODEL_PATH = 'models/freshness_model.h5'
+TFLITE_MODEL_PATH = 'models/freshness_model.tflite'
+INPUT_SIZE = (224, 224)  # Assuming model input size is 224x224
+
+def representative_dataset(sample_dir, num_samples=100):
+    # Yield preprocessed samples so the converter can calibrate int8 ranges
+    image_files = sorted(f for f in os.listdir(sample_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    for name in image_files[:num_samples]:
+        image = cv2.imread(os.path.join(sample_dir, name))
+        if image is None:
+            continue
+        image = cv2.resize(image, INPUT_SIZE)
+        image = image.astype('float32') / 255.0
+        yield [np.expand_dims(image, axis=0)]
+
+def convert_to_tflite(sample_dir, keras_path=KERAS_MODEL_PATH, tflite_path=TFLITE_MODEL_PATH):
+    # One-shot full-integer post-training quantization of the Keras model.
+    # The calibration data is scaled to [0, 1], so the uint8 input tensor normally
+    # ends up with scale 1/255 and zero point 0 and raw pixels can be fed directly;
+    # model_freshness checks the actual parameters when it loads the model.
+    model = tf.keras.models.load_model(keras_path)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: representative_dataset(sample_dir)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+
+    with open(tflite_path, 'wb') as f:
+        f.write(converter.convert())
+    return tflite_path
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python convert_to_tflite.py <sample_image_dir>")
+        sys.exit(1)
+    print(f"Saved quantized model to {convert_to_tflite(sys.argv[1])}")
@@ -1,25 +1,68 @@
+import threading
+from functools import lru_cache
 import tensorflow as tf
 import cv2
 import numpy as np
 
-# Load the trained model
-model = tf.keras.models.load_model('models/freshness_model.h5')
+MODEL_PATH = 'models/freshness_model.tflite'  # Quantized model, see convert_to_tflite.py
 
-def preprocess_image(image_path):
+# The interpreter is not safe to invoke from several Flask threads at once
+_interpreter_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _get_interpreter():
+    # Load the model once per process and prime its kernels with a dummy inference
+    interpreter = tf.lite.Interpreter(model_path=MODEL_PATH, num_threads=4)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+    interpreter.set_tensor(input_details['index'],
+                           np.zeros(input_details['shape'], dtype=input_details['dtype']))
+    interpreter.invoke()
+    return interpreter, input_details, output_details, _input_lut(input_details)
+
+def _input_lut(input_details):
+    # Pixels are fed as raw uint8, which is only right if the input tensor is
+    # quantized with scale 1/255 and zero point 0. The real parameters come from
+    # the calibration range, so check them and remap the pixels when they differ
+    if input_details['dtype'] != np.uint8:
+        raise ValueError(f"{MODEL_PATH}: expected a uint8 input tensor, got {input_details['dtype']}")
+    scale, zero_point = input_details['quantization']
+    if not scale:
+        raise ValueError(f"{MODEL_PATH}: input tensor is not quantized")
+    if np.isclose(scale, 1 / 255) and zero_point == 0:
+        return None
+    levels = np.arange(256) / 255.0 / scale + zero_point
+    return np.clip(np.round(levels), 0, 255).astype(np.uint8)
+
+def preprocess_image(image_path, out=None):
     # Preprocess the image for model prediction
     image = cv2.imread(image_path)
-    image = cv2.resize(image, (224, 224))  # Assuming model input size is 224x224
-    image = image.astype('float32') / 255.0
-    image = np.expand_dims(image, axis=0)
-    return image
+    if out is None:
+        out = np.empty((1, 224, 224, 3), dtype=np.uint8)
+    # Resize straight into the batch buffer (model input size is 224x224).
+    # The quantized model takes uint8 pixels, so no float conversion is needed
+    # (freshness_probability remaps them if the input quantization isn't 1/255)
+    cv2.resize(image, (224, 224), dst=out[0])
+    return out
 
-def predict_freshness(image_path):
-    # Predict freshness using the trained model
+def freshness_probability(image_path):
+    # Raw model output: probability that the item is fresh
+    # A fresh 150 KB input per call: the app serves each request on a new
+    # thread, so a per-thread buffer would never be reused
     image = preprocess_image(image_path)
-    prediction = model.predict(image)
+    interpreter, input_details, output_details, input_lut = _get_interpreter()
+    if input_lut is not None:
+        np.take(input_lut, image, out=image)
+    with _interpreter_lock:
+        interpreter.set_tensor(input_details['index'], image)
+        interpreter.invoke()
+        prediction = interpreter.get_tensor(output_details['index'])
+    return float(prediction[0][0])
 
+def predict_freshness(image_path):
     # Interpret prediction results
-    if prediction[0][0] > 0.5:
+    if freshness_probability(image_path) > 0.5:
         return "Fresh"
     else:
         return "Not Fresh"
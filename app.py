@@ -1,50 +1,384 @@
 import os
+import ast
+import atexit
+import json
+import re
 import base64
+import binascii
 import sqlite3
 import hashlib
+import hmac
+import logging
 import secrets
 import datetime
-from flask import Flask, render_template, request, jsonify, session
-from flask_cors import CORS
-from functools import wraps
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, has_app_context, render_template, request, jsonify, session
+from werkzeug.utils import secure_filename
 
 # Import the actual processing functions
 import random
 
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+    import numpy as np
+    from detection.object_count import count_and_draw_products
+except ImportError:
+    # OpenCV not installed - product count falls back to a mock result
+    cv2 = np = count_and_draw_products = None
+
+try:
+    from Freshness_detection.model_freshness import MODEL_PATH as FRESHNESS_MODEL_PATH, freshness_probability
+except ImportError:
+    # TensorFlow not installed - freshness falls back to a mock result
+    freshness_probability = None
+else:
+    if not os.path.exists(FRESHNESS_MODEL_PATH):
+        # Decided once here, so requests don't each retry loading a missing model
+        logger.warning("Freshness model %s not found, using mock results", FRESHNESS_MODEL_PATH)
+        freshness_probability = None
+
 def extract_text(file_path):
     # For now, return a sample response - can be replaced with actual OCR
     return "Sample OCR text: Product Name, Expiry Date, etc."
 
 def count_products(file_path):
+    # Detector count for the image, or None when detection can't run on it.
+    # None is never cached, so mock counts don't stick to an image hash
+    if count_and_draw_products is None:
+        return None
+    
     # Try to use the actual object detection function
     try:
-        import cv2
-        from detection.object_count import count_and_draw_products
-        
-        # Load the image
-        image = cv2.imread(file_path)
+        # Only the count is needed, so let the decoder produce grayscale directly
+        # (a third of the memory, and no separate colour conversion pass)
+        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
         if image is None:
-            return random.randint(1, 15)
+            return None
         
         # Use the actual detection function
-        _, count = count_and_draw_products(image.copy())
+        _, count = count_and_draw_products(image, draw=False)
         return count
-    except (ImportError, Exception) as e:
-        print(f"Detection error: {e}")
-        # Fallback to a more realistic mock that varies
-        return random.randint(1, 15)  # Random count between 1-15 instead of always 3
+    except Exception as e:
+        logger.warning("Detection error: %s", e)
+        return None
+
+try:
+    from turbojpeg import TurboJPEG
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG or libjpeg-turbo not installed - fall back to cv2.imencode
+    _turbo_jpeg = None
+
+JPEG_QUALITY = 75
+
+def encode_jpeg(image):
+    # SIMD-accelerated libjpeg-turbo encode when available
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(image, quality=JPEG_QUALITY)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer.tobytes()
+
+# Service results keyed by (service, image content hash) so that re-uploads of
+# the same image skip inference
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 256
+_result_cache_lock = threading.Lock()
+
+def _cached(service, digest, fn, *args):
+    key = (service, digest)
+    with _result_cache_lock:
+        if key in _RESULT_CACHE:
+            _RESULT_CACHE.move_to_end(key)
+            return _RESULT_CACHE[key]
+    result = fn(*args)
+    if result is None:
+        # No real result to remember
+        return None
+    with _result_cache_lock:
+        _RESULT_CACHE[key] = result
+        if len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+    return result
+
+# Multiple of 4 so each base64 slice decodes on its own
+SAVE_CHUNK_SIZE = 64 * 1024
+
+def save_chunks(chunks, file_path):
+    # Stream chunks to disk, hashing as we go so the file never has to be re-read
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, 'wb') as fh:
+            for chunk in chunks:
+                digest.update(chunk)
+                fh.write(chunk)
+    except Exception:
+        # Don't leave a truncated file behind when the source fails midway
+        os.remove(file_path)
+        raise
+    return digest.hexdigest()
+
+# Characters b64decode would silently skip (line breaks, spaces, ...)
+_NON_BASE64_RE = re.compile(r'[^A-Za-z0-9+/=]+')
+
+def iter_base64_chunks(data):
+    # Decode a base64 payload slice by slice instead of materialising it all
+    # at once. Skipped characters can shift the 4-character groups, so any
+    # incomplete group is carried over into the next slice
+    carry = ''
+    decoded = 0
+    for start in range(0, len(data), SAVE_CHUNK_SIZE):
+        piece = carry + _NON_BASE64_RE.sub('', data[start:start + SAVE_CHUNK_SIZE])
+        cut = len(piece) - len(piece) % 4
+        carry = piece[cut:]
+        if cut:
+            chunk = binascii.a2b_base64(piece[:cut])
+            decoded += len(chunk)
+            yield chunk
+    if carry:
+        chunk = binascii.a2b_base64(carry)
+        decoded += len(chunk)
+        yield chunk
+    if not decoded:
+        # Nothing but skipped characters (or bare padding): not an image
+        raise binascii.Error('No base64 data')
 
 app = Flask(__name__)
-CORS(app, supports_credentials=True, origins=['http://localhost:5174', 'http://localhost:5173'])  # Enable CORS for frontend with credentials
-app.secret_key = secrets.token_hex(16)  # For session management
+
+# CORS for the frontend dev servers, with credentials. The origin list is
+# fixed, so every header except the echoed origin is built once here
+CORS_ORIGINS = frozenset({'http://localhost:5174', 'http://localhost:5173'})
+CORS_HEADERS = (
+    ('Access-Control-Allow-Credentials', 'true'),
+    ('Access-Control-Expose-Headers', 'X-Object-Count, X-Timestamp'),
+    ('Vary', 'Origin'),
+)
+CORS_PREFLIGHT_HEADERS = (
+    ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS'),
+    ('Access-Control-Max-Age', '600'),
+)
+
+@app.before_request
+def cors_preflight():
+    # Answer preflights before routing or auth; the CORS headers are added below
+    if request.method == 'OPTIONS' and request.headers.get('Origin') in CORS_ORIGINS:
+        response = Response(status=204)
+        response.headers.extend(CORS_PREFLIGHT_HEADERS)
+        requested = request.headers.get('Access-Control-Request-Headers')
+        if requested:
+            response.headers['Access-Control-Allow-Headers'] = requested
+        return response
+    return None
+
+@app.after_request
+def add_cors_headers(response):
+    origin = request.headers.get('Origin')
+    if origin in CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers.extend(CORS_HEADERS)
+    return response
+
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)  # For session management
+
+# Keep sessions server-side in Redis when configured: lookups are a single
+# GET and sessions survive restarts (needs a fixed SECRET_KEY as well)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    try:
+        import redis
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.Redis.from_url(REDIS_URL)
+        Session(app)
+    except ImportError:
+        logger.warning("REDIS_URL is set but Flask-Session/redis are not installed; using cookie sessions")
 UPLOAD_FOLDER = 'static/uploads'
 PROFILE_PICTURES_FOLDER = 'static/profile_pictures'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROFILE_PICTURES_FOLDER'] = PROFILE_PICTURES_FOLDER
+app.config['DB_PATH'] = 'users.db'
+# Reject oversized uploads up front instead of spooling them to disk
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Uploaded files get unique names, so browsers can cache them for a day.
+# Flask's built-in /static route serves them with ETag/Last-Modified; in
+# production put nginx in front of /static/ (see SETUP.md)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 86400
+# Behind Apache mod_xsendfile / lighttpd, let the server stream files itself
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
 # Database setup
+# Werkzeug's server (app.run) starts a new thread for every request, so
+# per-thread connections would be rebuilt each time. Connections are pooled
+# process-wide instead: a request checks one out on first use and
+# teardown_appcontext hands it back with its PRAGMAs, statement cache and page
+# cache still warm
+DB_POOL_SIZE = 8
+_db_pools = {'rw': queue.LifoQueue(maxsize=DB_POOL_SIZE), 'ro': queue.LifoQueue(maxsize=DB_POOL_SIZE)}
+
+# Long-lived threads outside a request (startup, history writer) keep their own
+_db_local = threading.local()
+
+def _connect_rw():
+    conn = sqlite3.connect(app.config['DB_PATH'], check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
+    conn.executescript('''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-64000;
+    ''')
+    return conn
+
+def _connect_ro():
+    # Separate read-only connections for the read-heavy endpoints, so their
+    # cached statements never share a connection with writes
+    conn = sqlite3.connect(f"file:{app.config['DB_PATH']}?mode=ro", uri=True,
+                           check_same_thread=False, cached_statements=256)
+    conn.executescript('''
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-64000;
+    ''')
+    return conn
+
+_DB_CONNECTORS = {'rw': _connect_rw, 'ro': _connect_ro}
+
+def _checkout(kind):
+    if not has_app_context():
+        conn = getattr(_db_local, kind, None)
+        if conn is None:
+            conn = _DB_CONNECTORS[kind]()
+            setattr(_db_local, kind, conn)
+        return conn
+    conns = g.setdefault('db_conns', {})
+    conn = conns.get(kind)
+    if conn is None:
+        try:
+            conn = _db_pools[kind].get_nowait()
+        except queue.Empty:
+            conn = _DB_CONNECTORS[kind]()
+        conns[kind] = conn
+    return conn
+
+@app.teardown_appcontext
+def release_connections(exc):
+    for kind, conn in g.pop('db_conns', {}).items():
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _db_pools[kind].put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def _get_conn():
+    return _checkout('rw')
+
+def _get_ro_conn():
+    return _checkout('ro')
+
+# Hot statements are kept as module constants so the identical text always
+# hits the connection's prepared-statement cache
+SQL_GET_USER_BY_ID = '''
+    SELECT id, email, name, role, created_at, last_login, profile_picture 
+    FROM users WHERE id = ?
+'''
+SQL_GET_USER_BY_EMAIL = '''
+    SELECT id, email, name, password_hash, role, created_at, last_login, profile_picture 
+    FROM users WHERE email = ?
+'''
+SQL_USER_EXISTS = 'SELECT id FROM users WHERE email = ?'
+SQL_UPDATE_LAST_LOGIN = 'UPDATE users SET last_login = ? WHERE id = ?'
+# RETURNING needs SQLite 3.35+
+SQL_INSERT_USER = '''
+    INSERT INTO users (email, name, password_hash, role)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(email) DO NOTHING
+    RETURNING id
+'''
+
+INSERT_HISTORY_SQL = '''
+    INSERT INTO analysis_history 
+    (user_id, job_id, image_name, image_path, image_hash, services, results, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# History rows are queued by request handlers and written in batches by a
+# single background thread, one transaction per flush
+_history_queue = queue.Queue(maxsize=1000)
+_HISTORY_FLUSH_INTERVAL = 0.1  # seconds
+_history_writer_lock = threading.Lock()
+_history_writer_thread = None
+
+_HISTORY_STOP = None  # queued by _flush_history to stop the writer
+
+def _write_history(conn, rows):
+    try:
+        conn.execute('BEGIN')
+        conn.executemany(INSERT_HISTORY_SQL, rows)
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        logger.exception("History batch write failed, retrying %d rows one by one", len(rows))
+        # Rows come from different requests; one bad row or a transient
+        # lock must not take the others down with it
+        for row in rows:
+            try:
+                conn.execute(INSERT_HISTORY_SQL, row)
+            except sqlite3.Error:
+                logger.exception("Dropping history row for user %s, job %s", row[0], row[1])
+
+def _history_writer():
+    conn = _get_conn()
+    while True:
+        rows = [_history_queue.get()]
+        time.sleep(_HISTORY_FLUSH_INTERVAL)
+        while True:
+            try:
+                rows.append(_history_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = _HISTORY_STOP in rows
+        rows = [row for row in rows if row is not _HISTORY_STOP]
+        if rows:
+            _write_history(conn, rows)
+        if stop:
+            return
+
+@atexit.register
+def _flush_history():
+    # The writer is a daemon thread, so rows still queued at exit (including
+    # every debug reloader restart) would be lost after the client was told
+    # Success. Let it finish its batch, then write anything left synchronously
+    thread = _history_writer_thread
+    if thread is not None and thread.is_alive():
+        _history_queue.put(_HISTORY_STOP)
+        thread.join(timeout=10)
+    rows = []
+    while True:
+        try:
+            row = _history_queue.get_nowait()
+        except queue.Empty:
+            break
+        if row is not _HISTORY_STOP:
+            rows.append(row)
+    if rows:
+        _write_history(_get_conn(), rows)
+
+def record_history(row):
+    global _history_writer_thread
+    with _history_writer_lock:
+        if _history_writer_thread is None:
+            _history_writer_thread = threading.Thread(target=_history_writer, name='history-writer', daemon=True)
+            _history_writer_thread.start()
+    _history_queue.put(row)
+
 def init_db():
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -62,7 +396,6 @@ def init_db():
     # Add profile_picture column to existing tables (migration)
     try:
         cursor.execute('ALTER TABLE users ADD COLUMN profile_picture TEXT')
-        conn.commit()
     except sqlite3.OperationalError:
         # Column already exists
         pass
@@ -74,6 +407,7 @@ def init_db():
             job_id TEXT NOT NULL,
             image_name TEXT,
             image_path TEXT,
+            image_hash TEXT,
             services TEXT,
             results TEXT,
             status TEXT DEFAULT 'Success',
@@ -82,39 +416,114 @@ def init_db():
         )
     ''')
     
+    # History is always read per user, newest first
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_user_created
+        ON analysis_history (user_id, created_at DESC)
+    ''')
+    
+    # Add image_hash column to existing tables (migration)
+    try:
+        cursor.execute('ALTER TABLE analysis_history ADD COLUMN image_hash TEXT')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+    
+    # One-off data migrations; PRAGMA user_version records the last one applied
+    # so startup doesn't rescan the history table every time
+    schema_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+
+    if schema_version < 1:
+        # Convert results stored as Python reprs to JSON
+        cursor.execute('BEGIN')
+        cursor.execute('SELECT id, results FROM analysis_history WHERE results IS NOT NULL')
+        for history_id, raw_results in cursor.fetchall():
+            try:
+                json.loads(raw_results)
+            except ValueError:
+                try:
+                    converted = json.dumps(ast.literal_eval(raw_results), separators=(',', ':'), default=str)
+                except (ValueError, SyntaxError):
+                    converted = '{}'
+                cursor.execute('UPDATE analysis_history SET results = ? WHERE id = ?',
+                              (converted, history_id))
+        cursor.execute('PRAGMA user_version = 1')
+        cursor.execute('COMMIT')
+
+    if schema_version < 2:
+        # Convert comma-joined service lists to JSON arrays
+        cursor.execute('BEGIN')
+        cursor.execute('''
+            SELECT id, services FROM analysis_history
+            WHERE services IS NOT NULL AND services NOT LIKE '[%'
+        ''')
+        for history_id, services in cursor.fetchall():
+            cursor.execute('UPDATE analysis_history SET services = ? WHERE id = ?',
+                          (json.dumps(services.split(',') if services else []), history_id))
+        cursor.execute('PRAGMA user_version = 2')
+        cursor.execute('COMMIT')
+    
     # Create default admin user if not exists
-    cursor.execute('SELECT * FROM users WHERE email = ?', ('admin@company.com',))
+    cursor.execute(SQL_USER_EXISTS, ('admin@company.com',))
     if not cursor.fetchone():
         admin_password = hash_password('admin123')
         cursor.execute('''
             INSERT INTO users (email, name, password_hash, role)
             VALUES (?, ?, ?, ?)
         ''', ('admin@company.com', 'System Administrator', admin_password, 'admin'))
-    
-    conn.commit()
-    conn.close()
+
+def _scrypt(password, salt):
+    return hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1)
 
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    # Stored as "<salt hex>$<key hex>"
+    salt = os.urandom(16)
+    return f"{salt.hex()}${_scrypt(password, salt).hex()}"
 
-def require_auth(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({'error': 'Authentication required'}), 401
-        return f(*args, **kwargs)
-    return decorated_function
+def is_legacy_hash(password_hash):
+    # Hashes created before the scrypt migration are bare unsalted SHA-256
+    return '$' not in password_hash
 
-def get_user_by_id(user_id):
-    conn = sqlite3.connect('users.db')
+def verify_password(password, password_hash):
+    if is_legacy_hash(password_hash):
+        expected = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(password_hash, expected)
+    salt_hex, key_hex = password_hash.split('$', 1)
+    return hmac.compare_digest(_scrypt(password, bytes.fromhex(salt_hex)).hex(), key_hex)
+
+# Endpoints reachable without logging in; everything else requires a session
+PUBLIC_ENDPOINTS = {'login', 'signup', 'health_check', 'live_object_count',
+                    'live_object_count_raw', 'home', 'static'}
+
+@app.before_request
+def require_auth():
+    # One session lookup per request; views read the id from g.user_id
+    if request.method == 'OPTIONS' or request.endpoint is None or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({'error': 'Authentication required'}), 401
+    g.user_id = user_id
+
+# Short-lived cross-request cache of user profiles; entries are dropped
+# whenever the profile is written
+USER_CACHE_TTL = 30  # seconds
+USER_CACHE_SIZE = 1024
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    if 'user_cache' in g:
+        g.user_cache.pop(user_id, None)
+
+def _load_user(user_id):
+    conn = _get_ro_conn()
     cursor = conn.cursor()
     # Use column names to avoid index issues
-    cursor.execute('''
-        SELECT id, email, name, role, created_at, last_login, profile_picture 
-        FROM users WHERE id = ?
-    ''', (user_id,))
+    cursor.execute(SQL_GET_USER_BY_ID, (user_id,))
     user = cursor.fetchone()
-    conn.close()
     if user:
         return {
             'id': str(user[0]),
@@ -127,6 +536,29 @@ def get_user_by_id(user_id):
         }
     return None
 
+def get_user_by_id(user_id):
+    # Memoised for the current request in g, then in the TTL cache
+    request_cache = g.setdefault('user_cache', {})
+    if user_id in request_cache:
+        return request_cache[user_id]
+    
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+    if entry and entry[0] > now:
+        user = entry[1]
+    else:
+        user = _load_user(user_id)
+        if user:
+            with _user_cache_lock:
+                _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+                _user_cache.move_to_end(user_id)
+                if len(_user_cache) > USER_CACHE_SIZE:
+                    _user_cache.popitem(last=False)
+    
+    request_cache[user_id] = user
+    return user
+
 # Authentication endpoints
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -137,20 +569,22 @@ def login():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
     
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     # Use explicit column names
-    cursor.execute('''
-        SELECT id, email, name, password_hash, role, created_at, last_login, profile_picture 
-        FROM users WHERE email = ?
-    ''', (email,))
+    cursor.execute(SQL_GET_USER_BY_EMAIL, (email,))
     user = cursor.fetchone()
     
-    if user and user[3] == hash_password(password):
+    if user and verify_password(password, user[3]):
+        # Upgrade legacy SHA-256 hashes now that we have the plaintext
+        if is_legacy_hash(user[3]):
+            cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                          (hash_password(password), user[0]))
+        
         # Update last login
-        cursor.execute('UPDATE users SET last_login = ? WHERE id = ?', 
-                      (datetime.datetime.now().isoformat(), user[0]))
-        conn.commit()
+        now_iso = datetime.datetime.now().isoformat()
+        cursor.execute(SQL_UPDATE_LAST_LOGIN, (now_iso, user[0]))
+        invalidate_user(user[0])
         
         # Set session
         session['user_id'] = user[0]
@@ -161,14 +595,12 @@ def login():
             'name': user[2],
             'role': user[4],
             'createdAt': user[5],
-            'lastLogin': datetime.datetime.now().isoformat(),
+            'lastLogin': now_iso,
             'avatar': user[7] if user[7] else None
         }
         
-        conn.close()
         return jsonify({'user': user_data, 'message': 'Login successful'}), 200
     else:
-        conn.close()
         return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/auth/signup', methods=['POST'])
@@ -184,58 +616,49 @@ def signup():
     if len(password) < 6:
         return jsonify({'error': 'Password must be at least 6 characters'}), 400
     
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     
-    # Check if user already exists
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({'error': 'User already exists'}), 409
-    
-    # Create new user
+    # Create new user; the UNIQUE(email) constraint doubles as the existence
+    # check, so there is no separate SELECT and no race between the two
     password_hash = hash_password(password)
-    cursor.execute('''
-        INSERT INTO users (email, name, password_hash, role)
-        VALUES (?, ?, ?, ?)
-    ''', (email, name, password_hash, 'user'))
+    cursor.execute(SQL_INSERT_USER, (email, name, password_hash, 'user'))
+    row = cursor.fetchone()
+    if row is None:
+        return jsonify({'error': 'User already exists'}), 409
     
-    user_id = cursor.lastrowid
-    conn.commit()
+    user_id = row[0]
     
     # Set session
     session['user_id'] = user_id
     
+    now_iso = datetime.datetime.now().isoformat()
     user_data = {
         'id': str(user_id),
         'email': email,
         'name': name,
         'role': 'user',
         'avatar': None,
-        'createdAt': datetime.datetime.now().isoformat(),
-        'lastLogin': datetime.datetime.now().isoformat()
+        'createdAt': now_iso,
+        'lastLogin': now_iso
     }
     
-    conn.close()
     return jsonify({'user': user_data, 'message': 'Account created successfully'}), 201
 
 @app.route('/api/auth/logout', methods=['POST'])
-@require_auth
 def logout():
     session.clear()
     return jsonify({'message': 'Logged out successfully'}), 200
 
 @app.route('/api/auth/me', methods=['GET'])
-@require_auth
 def get_current_user():
-    user = get_user_by_id(session['user_id'])
+    user = get_user_by_id(g.user_id)
     if user:
         return jsonify({'user': user}), 200
     else:
         return jsonify({'error': 'User not found'}), 404
 
 @app.route('/api/auth/update-profile', methods=['PUT'])
-@require_auth
 def update_profile():
     data = request.get_json()
     name = data.get('name')
@@ -244,27 +667,36 @@ def update_profile():
     if not name or not email:
         return jsonify({'error': 'Name and email required'}), 400
     
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     
     # Check if email is already taken by another user
     cursor.execute('SELECT id FROM users WHERE email = ? AND id != ?', 
-                  (email, session['user_id']))
+                  (email, g.user_id))
     if cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Email already taken'}), 409
     
     # Update user
     cursor.execute('UPDATE users SET name = ?, email = ? WHERE id = ?',
-                  (name, email, session['user_id']))
-    conn.commit()
-    conn.close()
+                  (name, email, g.user_id))
+    invalidate_user(g.user_id)
     
-    user = get_user_by_id(session['user_id'])
+    user = get_user_by_id(g.user_id)
     return jsonify({'user': user, 'message': 'Profile updated successfully'}), 200
 
+def remove_unreferenced_avatar(cursor, avatar_url):
+    # Avatar files are shared by content hash, so only delete once unreferenced
+    cursor.execute('SELECT COUNT(*) FROM users WHERE profile_picture = ?', (avatar_url,))
+    if cursor.fetchone()[0]:
+        return
+    file_path = avatar_url.replace('/static/', 'static/')
+    if os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except:
+            pass
+
 @app.route('/api/auth/upload-avatar', methods=['POST'])
-@require_auth
 def upload_avatar():
     if 'avatar' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -281,118 +713,103 @@ def upload_avatar():
     if file_ext not in allowed_extensions:
         return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
     
-    # Generate unique filename
-    filename = f"user_{session['user_id']}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_ext}"
+    # Content-addressed filename: identical uploads share a single file
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    filename = f"{digest}.{file_ext}"
     file_path = os.path.join(app.config['PROFILE_PICTURES_FOLDER'], filename)
     
-    # Save file
-    file.save(file_path)
+    # Save file unless an identical one is already stored
+    if not os.path.exists(file_path):
+        with open(file_path, 'wb') as fh:
+            fh.write(data)
     
     # Update database
     avatar_url = f'/static/profile_pictures/{filename}'
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     
-    # Delete old profile picture if exists
-    cursor.execute('SELECT profile_picture FROM users WHERE id = ?', (session['user_id'],))
+    cursor.execute('SELECT profile_picture FROM users WHERE id = ?', (g.user_id,))
     old_avatar = cursor.fetchone()
-    if old_avatar and old_avatar[0]:
-        old_file_path = old_avatar[0].replace('/static/', 'static/')
-        if os.path.exists(old_file_path):
-            try:
-                os.remove(old_file_path)
-            except:
-                pass
     
     cursor.execute('UPDATE users SET profile_picture = ? WHERE id = ?',
-                  (avatar_url, session['user_id']))
-    conn.commit()
-    conn.close()
+                  (avatar_url, g.user_id))
+    invalidate_user(g.user_id)
+    
+    # Delete old profile picture if nobody uses it any more
+    if old_avatar and old_avatar[0] and old_avatar[0] != avatar_url:
+        remove_unreferenced_avatar(cursor, old_avatar[0])
     
-    user = get_user_by_id(session['user_id'])
+    user = get_user_by_id(g.user_id)
     return jsonify({'user': user, 'avatar': avatar_url, 'message': 'Avatar uploaded successfully'}), 200
 
 @app.route('/api/auth/delete-avatar', methods=['DELETE'])
-@require_auth
 def delete_avatar():
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     
     # Get current avatar
-    cursor.execute('SELECT profile_picture FROM users WHERE id = ?', (session['user_id'],))
+    cursor.execute('SELECT profile_picture FROM users WHERE id = ?', (g.user_id,))
     avatar = cursor.fetchone()
     
     if avatar and avatar[0]:
-        # Delete file
-        file_path = avatar[0].replace('/static/', 'static/')
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-        
         # Update database
-        cursor.execute('UPDATE users SET profile_picture = NULL WHERE id = ?', (session['user_id'],))
-        conn.commit()
-    
-    conn.close()
+        cursor.execute('UPDATE users SET profile_picture = NULL WHERE id = ?', (g.user_id,))
+        invalidate_user(g.user_id)
+        
+        # Delete file unless another user shares it
+        remove_unreferenced_avatar(cursor, avatar[0])
     
-    user = get_user_by_id(session['user_id'])
+    user = get_user_by_id(g.user_id)
     return jsonify({'user': user, 'message': 'Avatar deleted successfully'}), 200
 
 @app.route('/api/history', methods=['GET'])
-@require_auth
 def get_user_history():
-    conn = sqlite3.connect('users.db')
+    conn = _get_ro_conn()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT id, job_id, image_name, services, results, status, created_at
         FROM analysis_history 
         WHERE user_id = ? 
         ORDER BY created_at DESC
-    ''', (session['user_id'],))
+    ''', (g.user_id,))
     
     history = []
-    for row in cursor.fetchall():
+    # Stream rows off the cursor instead of materialising them all with fetchall()
+    for row in cursor:
         history.append({
             'id': row[0],
             'jobId': row[1],
             'imageName': row[2],
-            'services': row[3].split(',') if row[3] else [],
-            'results': eval(row[4]) if row[4] else {},
+            'services': json.loads(row[3]) if row[3] else [],
+            'results': json.loads(row[4]) if row[4] else {},
             'status': row[5],
             'metadata': {
                 'processedAt': row[6]
             }
         })
     
-    conn.close()
     return jsonify(history), 200
 
 @app.route('/api/history/<int:history_id>', methods=['DELETE'])
-@require_auth
 def delete_history_item(history_id):
-    conn = sqlite3.connect('users.db')
+    conn = _get_conn()
     cursor = conn.cursor()
     
     # Check if the history item exists and belongs to the current user
     cursor.execute('''
         SELECT id FROM analysis_history 
         WHERE id = ? AND user_id = ?
-    ''', (history_id, session['user_id']))
+    ''', (history_id, g.user_id))
     
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'History item not found or access denied'}), 404
     
     # Delete the history item
     cursor.execute('''
         DELETE FROM analysis_history 
         WHERE id = ? AND user_id = ?
-    ''', (history_id, session['user_id']))
-    
-    conn.commit()
-    conn.close()
+    ''', (history_id, g.user_id))
     
     return jsonify({'message': 'History item deleted successfully'}), 200
 
@@ -407,16 +824,14 @@ def live_object_count():
         if not frame_data:
             return jsonify({'error': 'No frame data provided'}), 400
         
-        # Decode base64 image
-        import cv2
-        import numpy as np
+        if count_and_draw_products is None:
+            return jsonify({'error': 'Object detection is not available', 'count': 0}), 503
         
         # Remove data URL prefix if present
-        if ',' in frame_data:
-            frame_data = frame_data.split(',')[1]
+        header, _, payload = frame_data.partition(',')
         
         # Decode base64 to image
-        img_bytes = base64.b64decode(frame_data)
+        img_bytes = binascii.a2b_base64(payload or header)
         nparr = np.frombuffer(img_bytes, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
@@ -424,8 +839,8 @@ def live_object_count():
             return jsonify({'error': 'Failed to decode frame'}), 400
         
         # Use existing object counting function
-        from detection.object_count import count_and_draw_products
-        annotated_frame, count = count_and_draw_products(frame.copy())
+        # The decoded frame is ours, so it can be annotated in place
+        annotated_frame, count = count_and_draw_products(frame, draw=include_boxes)
         
         response_data = {
             'count': count,
@@ -435,26 +850,114 @@ def live_object_count():
         # Include annotated frame if requested
         if include_boxes:
             # Encode annotated frame to base64
-            _, buffer = cv2.imencode('.jpg', annotated_frame)
-            annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+            annotated_base64 = base64.b64encode(encode_jpeg(annotated_frame)).decode('utf-8')
             response_data['annotated_frame'] = f'data:image/jpeg;base64,{annotated_base64}'
         
         return jsonify(response_data), 200
         
     except Exception as e:
-        print(f"Live count error: {e}")
+        logger.exception("Live count error")
+        return jsonify({'error': str(e), 'count': 0}), 500
+
+@app.route('/api/detect/live-count-raw', methods=['POST'])
+def live_object_count_raw():
+    """Process a single raw JPEG frame (sent as the request body) for live object counting"""
+    try:
+        if count_and_draw_products is None:
+            return jsonify({'error': 'Object detection is not available', 'count': 0}), 503
+        
+        frame_bytes = request.get_data(cache=False)
+        if not frame_bytes:
+            return jsonify({'error': 'No frame data provided'}), 400
+        
+        # Decode straight from the request body, no base64 round-trip
+        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return jsonify({'error': 'Failed to decode frame'}), 400
+        
+        include_boxes = request.args.get('include_boxes', '').lower() in ('1', 'true')
+        
+        annotated_frame, count = count_and_draw_products(frame, draw=include_boxes)
+        timestamp = datetime.datetime.now().isoformat()
+        
+        # Annotated frame is returned as a plain JPEG with the count in headers
+        if include_boxes:
+            response = Response(encode_jpeg(annotated_frame), mimetype='image/jpeg')
+            response.headers['X-Object-Count'] = str(count)
+            response.headers['X-Timestamp'] = timestamp
+            return response
+        
+        return jsonify({'count': count, 'timestamp': timestamp}), 200
+        
+    except Exception as e:
+        logger.exception("Live count error")
         return jsonify({'error': str(e), 'count': 0}), 500
 
-@app.route('/api/health', methods=['GET'])
+# Serialised once; a fresh Response wraps it per hit because after_request
+# hooks (CORS) add per-request headers to the response object
+_HEALTH_BODY = json.dumps({'status': 'healthy', 'message': 'Backend is running'})
+
+@app.route('/api/health', methods=['GET'], strict_slashes=False)
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Backend is running'}), 200
+    return Response(_HEALTH_BODY, status=200, mimetype='application/json')
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def _run_ocr(file_path, image_hash):
+    ocr_result = extract_text(file_path)
+    return {
+        'text': ocr_result if ocr_result else 'No text detected',
+        'boxes': []
+    }
+
+def _run_product_count(file_path, image_hash):
+    count_result = _cached('product_count', image_hash, count_products, file_path)
+    if count_result is None:
+        # Fallback to a more realistic mock that varies
+        count_result = random.randint(1, 15)  # Random count between 1-15 instead of always 3
+    return {
+        'total': count_result if isinstance(count_result, int) else 0,
+        'detections': []
+    }
+
+def _run_freshness(file_path, image_hash):
+    if freshness_probability is None:
+        # Mock freshness when the model is unavailable
+        return {'score': 8.5, 'label': 'Fresh', 'regions': []}
+    probability = _cached('freshness', image_hash, freshness_probability, file_path)
+    return {
+        'score': round(probability * 10, 1),
+        'label': 'Fresh' if probability > 0.5 else 'Not Fresh',
+        'regions': []
+    }
+
+def _run_brand(file_path, image_hash):
+    # Mock brand recognition since the import is commented out
+    return {
+        'matches': [
+            {'brand': 'Sample Brand', 'confidence': 0.85, 'bbox': [0, 0, 100, 100], 'isCounterfeit': False}
+        ]
+    }
+
+# Frontend service name -> (handler, result reported when the handler fails)
+SERVICES = {
+    'ocr': (_run_ocr, {'text': 'Error processing OCR', 'boxes': []}),
+    'product_count': (_run_product_count, {'total': 0, 'detections': []}),
+    'freshness': (_run_freshness, {'score': 0, 'label': 'Unknown', 'regions': []}),
+    'brand': (_run_brand, {'matches': []}),
+}
+
+def run_service(service, file_path, image_hash):
+    handler, error_result = SERVICES[service]
+    try:
+        return handler(file_path, image_hash)
+    except Exception:
+        logger.exception("%s service failed", service)
+        return error_result
+
 @app.route('/capture', methods=['POST'])
-@require_auth
 def capture_image():
     selected_services = request.form.getlist('services')
     
@@ -462,131 +965,84 @@ def capture_image():
     uploaded_file = request.files.get('image')
     captured_image = request.form.get('captured_image')
 
+    # Timestamp plus a random token keeps ids sortable and unique within a second
+    now = datetime.datetime.now()
+    stamp = f"{now.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+
+    # Both branches hash the image while saving it, so duplicate uploads can
+    # reuse earlier results
     if uploaded_file:
         # Save uploaded file
-        filename = f"user_{session['user_id']}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uploaded_file.filename}"
+        filename = f"user_{g.user_id}_{stamp}_{secure_filename(uploaded_file.filename)}"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        uploaded_file.save(file_path)
+        image_hash = save_chunks(iter(lambda: uploaded_file.stream.read(SAVE_CHUNK_SIZE), b''), file_path)
         image_name = uploaded_file.filename
     elif captured_image:
         # Decode base64 captured image and save it
-        filename = f"user_{session['user_id']}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_captured.jpg"
+        filename = f"user_{g.user_id}_{stamp}_captured.jpg"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(file_path, "wb") as fh:
-            fh.write(base64.b64decode(captured_image.split(",")[1]))
+        _, _, captured_b64 = captured_image.partition(',')
+        if not captured_b64:
+            return jsonify({'error': 'Invalid image data'}), 400
+        try:
+            image_hash = save_chunks(iter_base64_chunks(captured_b64), file_path)
+        except binascii.Error:
+            return jsonify({'error': 'Invalid image data'}), 400
         image_name = "Camera Capture"
     else:
         return jsonify({'error': 'No image provided'}), 400
 
     # Create job ID
-    job_id = f"job_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+    job_id = f"job_{stamp}"
 
-    # Process image based on selected services
+    # Process image based on selected services; they are independent, so
+    # they run concurrently and the request waits for the slowest one
     results = {}
+    error = None
     try:
-        # Map frontend service names to backend processing
-        service_mapping = {
-            'ocr': 'OCR',
-            'product_count': 'ProductCount', 
-            'freshness': 'Freshness',
-            'brand': 'BrandRecognition'
-        }
-        
-        if 'ocr' in selected_services:
-            try:
-                ocr_result = extract_text(file_path)
-                results['ocr'] = {
-                    'text': ocr_result if ocr_result else 'No text detected',
-                    'boxes': []
-                }
-            except Exception as e:
-                results['ocr'] = {'text': 'Error processing OCR', 'boxes': []}
-
-        if 'product_count' in selected_services:
-            try:
-                count_result = count_products(file_path)
-                results['product_count'] = {
-                    'total': count_result if isinstance(count_result, int) else 0,
-                    'detections': []
-                }
-            except Exception as e:
-                results['product_count'] = {'total': 0, 'detections': []}
-
-        if 'freshness' in selected_services:
-            try:
-                # Mock freshness since the import is commented out
-                results['freshness'] = {
-                    'score': 8.5,
-                    'label': 'Fresh',
-                    'regions': []
-                }
-            except Exception as e:
-                results['freshness'] = {'score': 0, 'label': 'Unknown', 'regions': []}
-
-        if 'brand' in selected_services:
-            try:
-                # Mock brand recognition since the import is commented out
-                results['brand'] = {
-                    'matches': [
-                        {'brand': 'Sample Brand', 'confidence': 0.85, 'bbox': [0, 0, 100, 100], 'isCounterfeit': False}
-                    ]
-                }
-            except Exception as e:
-                results['brand'] = {'matches': []}
-
-        # Save to user history
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO analysis_history 
-            (user_id, job_id, image_name, image_path, services, results, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            session['user_id'], 
-            job_id, 
-            image_name, 
-            file_path,
-            ','.join(selected_services),
-            str(results),
-            'Success'
-        ))
-        conn.commit()
-        conn.close()
-
-        response = {
-            'job_id': job_id,
-            'status': 'Success',
-            'results': results,
-            'metadata': {
-                'processed_at': datetime.datetime.now().isoformat()
-            }
-        }
-
-        return jsonify(response), 200
+        services = [service for service in dict.fromkeys(selected_services) if service in SERVICES]
+        if len(services) == 1:
+            results[services[0]] = run_service(services[0], file_path, image_hash)
+        elif services:
+            # Threads are per request, so concurrent captures never queue
+            # behind each other's services
+            with ThreadPoolExecutor(max_workers=len(services)) as pool:
+                outputs = pool.map(run_service, services, [file_path] * len(services),
+                                   [image_hash] * len(services))
+                results.update(zip(services, outputs))
 
     except Exception as e:
-        # Save failed analysis to history
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO analysis_history 
-            (user_id, job_id, image_name, image_path, services, results, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            session['user_id'], 
-            job_id, 
-            image_name, 
-            file_path,
-            ','.join(selected_services),
-            '{}',
-            'Failed'
-        ))
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'error': str(e), 'job_id': job_id, 'status': 'Failed'}), 500
+        error = e
+
+    # Save to user history - one write whichever way processing went
+    status = 'Failed' if error else 'Success'
+    record_history((
+        g.user_id, 
+        job_id, 
+        image_name, 
+        file_path,
+        image_hash,
+        json.dumps(selected_services),
+        '{}' if error else json.dumps(results, separators=(',', ':'), default=str),
+        status
+    ))
+
+    if error:
+        return jsonify({'error': str(error), 'job_id': job_id, 'status': status}), 500
+
+    response = {
+        'job_id': job_id,
+        'status': status,
+        'results': results,
+        'metadata': {
+            'processed_at': now.isoformat()
+        }
+    }
+
+    return jsonify(response), 200
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     # Initialize database and folders
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(PROFILE_PICTURES_FOLDER, exist_ok=True)
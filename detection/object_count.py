@@ -1,11 +1,58 @@
+import queue
+import threading
 import cv2
 import numpy as np
 
+# Structuring element shared by every call
+KERNEL = np.ones((3, 3), np.uint8)
+
+# Per-thread scratch images, reallocated only when the frame size changes
+_buffers = threading.local()
+
+def _scratch(shape):
+    bufs = getattr(_buffers, 'scratch', None)
+    if bufs is None or bufs['gray'].shape != shape:
+        bufs = _buffers.scratch = {
+            'gray': np.empty(shape, np.uint8),
+            'blurred': np.empty(shape, np.uint8),
+            'morph': np.empty(shape, np.uint8),
+            'thresh': np.empty(shape, np.uint8),
+        }
+    return bufs
+
+def _contour_stats(contours):
+    """
+    Areas and bounding boxes of all contours at once.
+
+    Same numbers as cv2.contourArea / cv2.boundingRect per contour: the
+    shoelace sum runs over every point of the concatenated contours and is
+    reduced per contour, so the cost no longer scales with Python iterations.
+    """
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=len(contours))
+    starts = np.zeros(len(contours), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    pts = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    x, y = pts[:, 0], pts[:, 1]
+
+    # Index of each point's successor, wrapping to the first point of its contour
+    nxt = np.arange(1, len(pts) + 1)
+    nxt[starts + lengths - 1] = starts
+    cross = x * y[nxt] - x[nxt] * y
+    area = np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+    bx = np.minimum.reduceat(x, starts)
+    by = np.minimum.reduceat(y, starts)
+    bw = np.maximum.reduceat(x, starts) - bx + 1
+    bh = np.maximum.reduceat(y, starts) - by + 1
+    return area, np.stack([bx, by, bw, bh], axis=1)
+
 def count_and_draw_products(image, 
                             min_contour_area=1500,      # Balanced: not too strict, not too loose
                             min_width=25,                # Minimum width in pixels
                             min_height=25,               # Minimum height in pixels
-                            max_aspect_ratio=8.0):       # Max width/height ratio
+                            max_aspect_ratio=8.0,        # Max width/height ratio
+                            draw=True,                   # Annotate the image in place
+                            scale=1):                    # Downscale factor for analysis
     """
     Detect and count products in an image with noise reduction.
     
@@ -14,76 +61,115 @@ def count_and_draw_products(image,
     - min_width: Minimum bounding box width (default 40)
     - min_height: Minimum bounding box height (default 40)
     - max_aspect_ratio: Maximum width/height ratio to filter elongated shapes (default 5.0)
+    - draw: Draw boxes and labels onto `image` (mutates it). Pass False when only
+      the count is needed so callers don't have to copy the frame.
+    - scale: Run the pipeline on an image shrunk by this integer factor (default 1).
+      Size thresholds are given in full-resolution pixels and boxes are mapped
+      back, but the blur, morphology and threshold windows stay fixed in pixels,
+      so counts differ from scale=1 and the other defaults may need retuning.
+    
+    `image` may be BGR or already single-channel grayscale.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    source = image
+    if scale > 1:
+        source = cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+
+    # Every stage writes into reused scratch buffers instead of allocating
+    bufs = _scratch(source.shape[:2])
+    gray = source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_BGR2GRAY, dst=bufs['gray'])
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0, dst=bufs['blurred'])
     
     # Apply morphological operations to reduce noise
-    kernel = np.ones((3, 3), np.uint8)
-    morph = cv2.morphologyEx(blurred, cv2.MORPH_CLOSE, kernel, iterations=2)
+    morph = cv2.morphologyEx(blurred, cv2.MORPH_CLOSE, KERNEL, dst=bufs['morph'], iterations=2)
     
     thresh = cv2.adaptiveThreshold(morph, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
+                                   cv2.THRESH_BINARY_INV, 11, 2, dst=bufs['thresh'])
     
-    # Additional morphological cleaning
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
+    # Additional morphological cleaning (morph is free again by now)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, KERNEL, dst=bufs['morph'], iterations=1)
     
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Apply multiple filters to reduce noise
-    filtered_contours = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        
-        # Filter 1: Area threshold
-        if area < min_contour_area:
-            continue
-        
-        # Get bounding rectangle
-        x, y, w, h = cv2.boundingRect(cnt)
-        
-        # Filter 2: Minimum width and height
-        if w < min_width or h < min_height:
-            continue
-        
-        # Filter 3: Aspect ratio (avoid very elongated shapes)
-        aspect_ratio = max(w, h) / min(w, h)
-        if aspect_ratio > max_aspect_ratio:
-            continue
-        
-        filtered_contours.append(cnt)
+    if not contours:
+        return image, 0
+
+    # Apply multiple filters to reduce noise, over all contours at once
+    area, rects = _contour_stats(contours)
+    w = rects[:, 2]
+    h = rects[:, 3]
+    # Filter 1: Area threshold
+    keep = area >= min_contour_area / scale ** 2
+    # Filter 2: Minimum width and height
+    keep &= (w >= min_width / scale) & (h >= min_height / scale)
+    # Filter 3: Aspect ratio (avoid very elongated shapes)
+    keep &= np.maximum(w, h) / np.minimum(w, h) <= max_aspect_ratio
+    boxes = rects[keep] * scale
+
+    if not draw:
+        return image, len(boxes)
 
     # Draw bounding boxes and labels
-    for idx, contour in enumerate(filtered_contours):
-        x, y, w, h = cv2.boundingRect(contour)
+    for idx, (x, y, w, h) in enumerate(boxes.tolist()):
         cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
         cv2.putText(image, str(idx + 1), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
 
-    return image, len(filtered_contours)
-
-def process_realtime_video(source):
-    cap = cv2.VideoCapture(source)
+    return image, len(boxes)
 
-    if not cap.isOpened():
-        print("Error: Could not open video stream.")
-        return
+# Downscale factor for live frames; above 1 trades counting accuracy for fps
+# (see count_and_draw_products)
+VIDEO_SCALE = 1
 
-    while cap.isOpened():
+def _capture_frames(cap, frames, stop):
+    # Grab and annotate frames off the display thread; when the display falls
+    # behind, the oldest pending frame is dropped instead of stalling capture
+    while not stop.is_set():
         ret, frame = cap.read()
         if not ret:
             print("Failed to grab frame.")
             break
 
-        processed_frame, count = count_and_draw_products(frame)
+        processed_frame, count = count_and_draw_products(frame, scale=VIDEO_SCALE)
         
         cv2.putText(processed_frame, f'Total Items: {count}', (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
+        try:
+            frames.put_nowait(processed_frame)
+        except queue.Full:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+            frames.put_nowait(processed_frame)
+
+def process_realtime_video(source):
+    cap = cv2.VideoCapture(source)
+
+    if not cap.isOpened():
+        print("Error: Could not open video stream.")
+        return
+
+    # Keep the driver from queueing stale frames behind the one being processed
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    frames = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    worker = threading.Thread(target=_capture_frames, args=(cap, frames, stop), daemon=True)
+    worker.start()
+
+    # GUI calls stay on this thread; it only shows what the worker produced
+    while worker.is_alive() or not frames.empty():
+        try:
+            processed_frame = frames.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
         cv2.imshow("Real-Time Object Detection", processed_frame)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    stop.set()
+    worker.join()
     cap.release()
     cv2.destroyAllWindows()
 
@@ -55,31 +55,26 @@ const LiveDetectionModal: React.FC<LiveDetectionModalProps> = ({ onClose }) => {
         // Draw current frame
         context.drawImage(video, 0, 0);
 
-        // Convert to base64
-        const frameData = canvas.toDataURL('image/jpeg', 0.8);
+        // Encode as a raw JPEG blob (no base64 overhead)
+        const frameBlob = await new Promise<Blob | null>(resolve =>
+          canvas.toBlob(resolve, 'image/jpeg', 0.8)
+        );
+        if (!frameBlob) return;
 
         // Send for detection with boxes
-        const response = await fetch('http://localhost:5001/api/detect/live-count', {
+        const response = await fetch('http://localhost:5001/api/detect/live-count-raw?include_boxes=1', {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ 
-            frame: frameData,
-            include_boxes: true 
-          })
+          headers: { 'Content-Type': 'image/jpeg' },
+          body: frameBlob
         });
 
         if (response.ok) {
-          const data = await response.json();
-          setObjectCount(data.count || 0);
+          setObjectCount(Number(response.headers.get('X-Object-Count')) || 0);
 
           // Display annotated frame with boxes
-          if (data.annotated_frame) {
-            const img = new Image();
-            img.onload = () => {
-              displayContext.drawImage(img, 0, 0);
-            };
-            img.src = data.annotated_frame;
-          }
+          const annotatedFrame = await createImageBitmap(await response.blob());
+          displayContext.drawImage(annotatedFrame, 0, 0);
+          annotatedFrame.close();
 
           // Calculate FPS
           frameCount++;
@@ -1,5 +1,10 @@
 import re
 
+# Manufacturing and expiration dates in "MMM-YYYY" or "MM-YYYY" formats,
+# compiled once instead of per line
+_MFG_RE = re.compile(r"\b(Mfg|Manufacture|Mfd|Prep).*?(\b\w{3}-\d{4}\b|\d{2}-\d{4})", re.IGNORECASE)
+_EXP_RE = re.compile(r"\b(Exp|Expiry|Exp\.).*?(\b\w{3}-\d{4}\b|\d{2}-\d{4})", re.IGNORECASE)
+
 def classify_product_name(text_data):
     # Extract the first identifiable product name line
     for line in text_data:
@@ -7,18 +12,22 @@ def classify_product_name(text_data):
             return line.strip()
     return "N/A"
 
+def _match_dates(line, mfg_date, exp_date):
+    # Dates found on this line replace the ones seen so far
+    mfg_match = _MFG_RE.search(line)
+    exp_match = _EXP_RE.search(line)
+    
+    if mfg_match:
+        mfg_date = mfg_match.group(2)  # Get the date part of the match
+    if exp_match:
+        exp_date = exp_match.group(2)
+    return mfg_date, exp_date
+
 def classify_dates(text_data):
     mfg_date, exp_date = "N/A", "N/A"
     
     for line in text_data:
-        # Look for manufacturing and expiration dates in "MMM-YYYY" or "MM-YYYY" formats
-        mfg_match = re.search(r"\b(Mfg|Manufacture|Mfd|Prep).*?(\b\w{3}-\d{4}\b|\d{2}-\d{4})", line, re.IGNORECASE)
-        exp_match = re.search(r"\b(Exp|Expiry|Exp\.).*?(\b\w{3}-\d{4}\b|\d{2}-\d{4})", line, re.IGNORECASE)
-        
-        if mfg_match:
-            mfg_date = mfg_match.group(2)  # Get the date part of the match
-        if exp_match:
-            exp_date = exp_match.group(2)
+        mfg_date, exp_date = _match_dates(line, mfg_date, exp_date)
     
     return mfg_date, exp_date
 
@@ -26,17 +35,28 @@ def classify_product_type(text_data):
     # Return "N/A" since no specific product type is discernable
     return "N/A"
 
+def classify(lines):
+    # Single pass over any iterable of lines (e.g. an open file) that does the
+    # work of all the classifiers above together
+    product_name, mfg_date, exp_date = "N/A", "N/A", "N/A"
+    
+    for line in lines:
+        if product_name == "N/A" and "giloy" in line.lower():
+            product_name = line.strip()
+        mfg_date, exp_date = _match_dates(line, mfg_date, exp_date)
+    
+    # Product type has no per-line rules yet (see classify_product_type); when it
+    # gets some, they belong in the loop above
+    product_type = "N/A"
+    
+    return product_name, mfg_date, exp_date, product_type
+
 # Path to the OCR text file
 ocr = "D:/FlipKart GRiD 6.0 Robotic Track/prototype/project/ocr/ocr.txt"
 
-# Read the file
+# Classifications, streamed line by line from the file
 with open(ocr, 'r') as file:
-    text_data = file.readlines()
-
-# Classifications
-product_name = classify_product_name(text_data)
-mfg_date, exp_date = classify_dates(text_data)
-product_type = classify_product_type(text_data)
+    product_name, mfg_date, exp_date, product_type = classify(file)
 
 # Store results in text file
 with open("product_classifier.txt", "w") as output_file:
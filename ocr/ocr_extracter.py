@@ -1,15 +1,53 @@
-import pytesseract
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from tesserocr import PyTessBaseAPI, PSM
 from PIL import Image
 
+# Keep one Tesseract engine resident per thread instead of spawning a
+# tesseract subprocess (and reloading language data) on every call
+_local = threading.local()
+
+# Extracted text keyed by image content hash, so re-submitted images skip OCR
+_OCR_CACHE = OrderedDict()
+_OCR_CACHE_SIZE = 512
+_ocr_cache_lock = threading.Lock()
+
+def _get_api():
+    api = getattr(_local, 'api', None)
+    if api is None:
+        api = PyTessBaseAPI(lang='eng', psm=PSM.AUTO)
+        _local.api = api
+    return api
+
 def extract_text(image_path):
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    with _ocr_cache_lock:
+        if digest in _OCR_CACHE:
+            _OCR_CACHE.move_to_end(digest)
+            return _OCR_CACHE[digest]
+
     #  OCR operation
-    image = Image.open(image_path)
-    text = pytesseract.image_to_string(image)
+    api = _get_api()
+    with Image.open(io.BytesIO(data)) as image:
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+
+    with _ocr_cache_lock:
+        _OCR_CACHE[digest] = text
+        if len(_OCR_CACHE) > _OCR_CACHE_SIZE:
+            _OCR_CACHE.popitem(last=False)
     return text
 
-path="Test2.jpg"
-a=extract_text(path)
+if __name__ == "__main__":
+    # Only run the sample extraction when executed directly, so importing the
+    # module just sets up the resident engine
+    path="Test2.jpg"
+    a=extract_text(path)
 
-with open("ocr.txt",'w') as ocr_file:
-    ocr_file.write(a)
-print("file saved")
\ No newline at end of file
+    with open("ocr.txt",'w') as ocr_file:
+        ocr_file.write(a)
+    print("file saved")